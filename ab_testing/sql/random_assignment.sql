@@ -12,7 +12,8 @@ Business Context:
     - Used to test if a retention offer improves reactivation and revenue.
     - Group A (Control): No offer / baseline performance.
     - Group B (Treatment): Receives retention incentive or communication.
-    - Eligible customers are those classified as "AT_RISK" via churn logic.
+    - Eligible customers are those classified as "AT_RISK" via churn logic
+      (risk_status in gold.customer_segments, loaded by cohort_rfm_engine.py).
 
 Assignment Logic:
     - NEWID() + CHECKSUM() used to produce a pseudo-random split.
@@ -26,7 +27,7 @@ Key Conditions:
     • Assignment date stored for time-based analysis.
 
 Data Flow:
-    1. Identify eligible customers (v_customer_churn_status)
+    1. Identify eligible customers (gold.customer_segments)
     2. Assign A/B groups
     3. Insert into gold.ab_customer_assignment
     4. Outcomes tracked in gold.ab_test_outcomes
@@ -50,11 +51,11 @@ SELECT
     'Retention_Offer_Test' AS experiment_name,
     CASE WHEN ABS(CHECKSUM(NEWID())) % 2 = 0 THEN 'A' ELSE 'B' END AS experiment_group,
     CAST(GETDATE() AS DATE) AS assigned_at
-FROM gold.v_customer_churn_status
+FROM gold.customer_segments
 WHERE risk_status = 'AT_RISK'
   AND NOT EXISTS (
       SELECT 1
       FROM gold.ab_customer_assignment a
-      WHERE a.customer_key = gold.v_customer_churn_status.customer_key
+      WHERE a.customer_key = gold.customer_segments.customer_key
         AND a.experiment_name = 'Retention_Offer_Test'
   );
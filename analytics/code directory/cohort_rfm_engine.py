@@ -0,0 +1,494 @@
+"""
+===============================================================================
+Cohort Retention & RFM Segmentation Engine
+===============================================================================
+Purpose:
+    - To generalize churn_analysis and data_segmentation_analysis into a single
+      Python engine that reads gold.fact_sales once and produces, for every
+      customer in one pass:
+        • Monthly acquisition-cohort retention matrix
+        • RFM (Recency, Frequency, Monetary) quantile scores
+        • Configurable customer segments (VIP / Regular / New by default)
+        • Churn risk status (ACTIVE / AT_RISK / CHURNED)
+    - To cache the results as flat tables that the churn risk status, the AI
+      insights generator and the A/B eligibility filter can all reuse.
+
+Business Context:
+    - churn_analysis only flags customers inactive for more than 90 days.
+    - The VIP / Regular / New split in data_segmentation_analysis and
+      gold.report_customers is a hard-coded CASE expression.
+    - This engine keeps the same business definitions as defaults but makes
+      thresholds and segment rules configurable, and adds cohort retention.
+
+Data Source:
+    - gold.fact_sales (CSV export in analytics/data directory, or SQL Server)
+        • order_number
+        • customer_key
+        • order_date
+        • sales_amount
+    - gold.dim_customers (every customer, incl. those with no purchases; country)
+      Both tables are read from the same SOURCE (CSV export or SQL Server).
+
+Logic Overview:
+    1. Load fact_sales lines (rows with NULL order_date are ignored, like MAX()).
+    2. Sort once by (customer, order_date, order_number) with NumPy and derive
+       group boundaries from the sorted keys:
+        • first / last order date, distinct orders, revenue per customer
+        • distinct (customer, month) activity pairs for cohort retention
+    3. Merge the batch into the cached state (incremental refresh):
+        • Only order lines with order_date after the cached watermark are loaded.
+          SOURCE = "sql" pushes the filter into the query; the CSV export is
+          still scanned in chunks, but only new lines are kept and parsed.
+        • A (customer, month) pair already counted in the cached state is not
+          counted again when the watermark month continues in the new batch.
+    4. Left-join gold.dim_customers so customers with no purchases are kept
+       (CHURNED, like churn_analysis), then score RFM quantiles and apply
+       segment rules and churn thresholds.
+    5. Write cached tables to CACHE_DIR and, with --to-sql, replace
+       gold.customer_segments (see datawarehouse/scripts/gold/ddl_customer_segments.sql).
+
+Cached Tables (CACHE_DIR):
+    - customer_state.csv       Per-customer aggregates + watermark (refresh state)
+    - cohort_activity.csv      Active customers per cohort month and period
+    - cohort_retention.csv     Retention matrix (rows = cohort, cols = period;
+                               empty where the period is not observed yet)
+    - customer_segments.csv    RFM scores, segment and risk_status per customer
+                               (same columns as gold.v_ai_churn_input, so it can
+                               feed ai_insights.py directly; --to-sql loads it
+                               into gold.customer_segments for the churn status
+                               view and the A/B eligibility filter)
+
+Assumptions:
+    - Order lines land by whole order_date: a refresh never receives more lines
+      for a date that is already at or before the cached watermark.
+
+Python & Database Tools:
+    - numpy: Sort-based grouping (lexsort + reduceat) and quantile scoring
+    - pandas: CSV I/O and cached table assembly
+    - pyodbc: Optional SQL Server source (SOURCE = "sql")
+
+Usage:
+    Full rebuild from the CSV export:
+        python cohort_rfm_engine.py --full
+
+    Incremental refresh after new months land:
+        python cohort_rfm_engine.py
+
+    Refresh and publish to gold.customer_segments:
+        python cohort_rfm_engine.py --to-sql
+===============================================================================
+"""
+
+import argparse
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+# -----------------------------
+# CONFIG
+# -----------------------------
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DATA_DIR = os.path.join(BASE_DIR, "..", "data directory")
+
+SOURCE = "csv"  # "csv" or "sql"
+FACT_SALES_CSV = os.path.join(DATA_DIR, "gold.fact_sales.csv")
+DIM_CUSTOMERS_CSV = os.path.join(DATA_DIR, "gold.dim_customers.csv")
+CACHE_DIR = os.path.join(BASE_DIR, "customer_engine_cache")
+CSV_CHUNK_ROWS = 1_000_000
+
+SERVER = r"DESKTOP-CUKPVKG\SQLEXPRESS"
+DATABASE = "DataWarehouseAnalytics"
+
+# Churn thresholds (days since last purchase)
+AT_RISK_DAYS = 90
+CHURNED_DAYS = 180
+
+# Number of quantile buckets for R, F and M scores
+RFM_QUANTILES = 5
+
+# Ordered segment rules: first matching rule wins, DEFAULT_SEGMENT otherwise.
+# Expressions are evaluated with DataFrame.eval over customer_segments columns.
+SEGMENT_RULES = [
+    ("No Purchase", "lifetime_orders == 0"),
+    ("VIP", "lifespan_months >= 12 and lifetime_revenue > 5000"),
+    ("Regular", "lifespan_months >= 12 and lifetime_revenue <= 5000"),
+]
+DEFAULT_SEGMENT = "New"
+
+STATE_COLUMNS = [
+    "customer_key",
+    "first_order_date",
+    "last_order_date",
+    "lifetime_orders",
+    "lifetime_revenue",
+]
+
+
+# -----------------------------
+# Helpers
+# -----------------------------
+def _month_index(days: np.ndarray) -> np.ndarray:
+    """Convert datetime64[D] values to a running month number (year * 12 + month)."""
+    return days.astype("datetime64[M]").astype(np.int64)
+
+
+def _month_label(months: np.ndarray) -> np.ndarray:
+    return months.astype("datetime64[M]").astype(str)
+
+
+def _quantile_score(values: np.ndarray, q: int) -> np.ndarray:
+    """
+    Score values 1..q by rank; ties share the score of the bottom of their block.
+
+    The share of customers strictly below a value decides its bucket, so the
+    lowest tie block (e.g. all one-order customers) always scores 1.
+    """
+    if len(values) == 0:
+        return np.zeros(0, dtype=np.int64)
+    ordered = np.sort(values)
+    below = np.searchsorted(ordered, values, side="left")
+    return (below * q // len(values) + 1).astype(np.int64)
+
+
+def _connect():
+    """Open a trusted ODBC connection to the warehouse (SOURCE = "sql")."""
+    import pyodbc
+
+    conn_str = (
+        f"DRIVER={{ODBC Driver 17 for SQL Server}};"
+        f"SERVER={SERVER};"
+        f"DATABASE={DATABASE};"
+        "Trusted_Connection=yes;"
+    )
+    return pyodbc.connect(conn_str, timeout=10)
+
+
+# -----------------------------
+# 1) Load fact_sales
+# -----------------------------
+def load_fact_sales(after_date=None) -> pd.DataFrame:
+    """Read order lines, optionally only those after the cached watermark."""
+    columns = ["order_number", "customer_key", "order_date", "sales_amount"]
+
+    if SOURCE == "sql":
+        query = f"SELECT {', '.join(columns)} FROM gold.fact_sales WHERE order_date IS NOT NULL"
+        params = []
+        if after_date is not None:
+            query += " AND order_date > ?"
+            params.append(str(after_date))
+        conn = _connect()
+        df = pd.read_sql(query, conn, params=params)
+        conn.close()
+    elif after_date is None:
+        df = pd.read_csv(FACT_SALES_CSV, usecols=columns)
+    else:
+        # Filter while reading so only new lines are kept in memory; ISO dates
+        # compare correctly as strings, which skips parsing old rows.
+        cutoff = pd.Timestamp(after_date).strftime("%Y-%m-%d")
+        chunks = pd.read_csv(FACT_SALES_CSV, usecols=columns, dtype={"order_date": str}, chunksize=CSV_CHUNK_ROWS)
+        df = pd.concat(
+            [chunk[chunk["order_date"].fillna("") > cutoff] for chunk in chunks],
+            ignore_index=True,
+        )
+
+    df["order_date"] = pd.to_datetime(df["order_date"], errors="coerce")
+    df = df.dropna(subset=["customer_key", "order_date"])
+    if after_date is not None:
+        df = df[df["order_date"] > pd.Timestamp(after_date)]
+    return df
+
+
+# -----------------------------
+# 2) Sort-based grouping
+# -----------------------------
+def aggregate_batch(df: pd.DataFrame) -> dict:
+    """
+    Aggregate a batch of order lines with a single lexsort.
+
+    Returns per-customer arrays (customer_key, first/last day, orders, revenue)
+    and the distinct (customer_key, month) activity pairs.
+    """
+    cust = df["customer_key"].to_numpy(dtype=np.int64)
+    day = df["order_date"].to_numpy(dtype="datetime64[D]")
+    order_code, _ = pd.factorize(df["order_number"])
+    amount = df["sales_amount"].fillna(0).to_numpy(dtype=np.float64)
+
+    order = np.lexsort((order_code, day, cust))
+    cust, day = cust[order], day[order]
+    order_code, amount = order_code[order], amount[order]
+    month = _month_index(day)
+
+    n = len(cust)
+    new_cust = np.ones(n, dtype=bool)
+    new_cust[1:] = cust[1:] != cust[:-1]
+    new_order = new_cust.copy()
+    new_order[1:] |= (order_code[1:] != order_code[:-1]) | (day[1:] != day[:-1])
+    new_pair = new_cust.copy()
+    new_pair[1:] |= month[1:] != month[:-1]
+
+    starts = np.flatnonzero(new_cust)
+    ends = np.r_[starts[1:] - 1, n - 1] if n else starts
+
+    return {
+        "customer_key": cust[starts],
+        "first_order_date": day[starts],
+        "last_order_date": day[ends],
+        "lifetime_orders": np.add.reduceat(new_order.astype(np.int64), starts) if n else np.zeros(0, np.int64),
+        "lifetime_revenue": np.add.reduceat(amount, starts) if n else np.zeros(0),
+        "pair_customer": cust[new_pair],
+        "pair_month": month[new_pair],
+    }
+
+
+# -----------------------------
+# 3) Merge into cached state
+# -----------------------------
+def load_state():
+    """Return (customer_state, cohort_activity) from CACHE_DIR, or (None, None)."""
+    state_path = os.path.join(CACHE_DIR, "customer_state.csv")
+    activity_path = os.path.join(CACHE_DIR, "cohort_activity.csv")
+    if not (os.path.exists(state_path) and os.path.exists(activity_path)):
+        return None, None
+    state = pd.read_csv(state_path, parse_dates=["first_order_date", "last_order_date"])
+    activity = pd.read_csv(activity_path)
+    return state, activity
+
+
+def merge_batch(state: pd.DataFrame, activity: pd.DataFrame, batch: dict):
+    """Fold a new batch into the cached customer state and cohort activity."""
+    if state is None:
+        state = pd.DataFrame({c: [] for c in STATE_COLUMNS})
+        activity = pd.DataFrame({"cohort_month_idx": [], "period": [], "active_customers": []})
+
+    old_cust = state["customer_key"].to_numpy(dtype=np.int64)
+    old_first = state["first_order_date"].to_numpy(dtype="datetime64[D]")
+    old_last = state["last_order_date"].to_numpy(dtype="datetime64[D]")
+
+    # Drop activity pairs already counted in the watermark month
+    pos = np.searchsorted(old_cust, batch["pair_customer"])
+    pos_ok = np.minimum(pos, max(len(old_cust) - 1, 0))
+    known = (pos < len(old_cust)) & (old_cust[pos_ok] == batch["pair_customer"]) if len(old_cust) else np.zeros(len(pos), bool)
+    already = known.copy()
+    if len(old_cust):
+        already[known] = _month_index(old_last[pos_ok[known]]) == batch["pair_month"][known]
+    pair_cust = batch["pair_customer"][~already]
+    pair_month = batch["pair_month"][~already]
+
+    # Combine old and new customer aggregates (both sorted by customer_key)
+    cust = np.concatenate([old_cust, batch["customer_key"]])
+    first = np.concatenate([old_first, batch["first_order_date"]])
+    last = np.concatenate([old_last, batch["last_order_date"]])
+    orders = np.concatenate([state["lifetime_orders"].to_numpy(dtype=np.int64), batch["lifetime_orders"]])
+    revenue = np.concatenate([state["lifetime_revenue"].to_numpy(dtype=np.float64), batch["lifetime_revenue"]])
+
+    order = np.argsort(cust, kind="stable")
+    cust, first, last = cust[order], first[order], last[order]
+    orders, revenue = orders[order], revenue[order]
+    starts = np.flatnonzero(np.r_[True, cust[1:] != cust[:-1]]) if len(cust) else np.zeros(0, np.int64)
+
+    merged = pd.DataFrame({
+        "customer_key": cust[starts],
+        "first_order_date": np.minimum.reduceat(first, starts) if len(cust) else first,
+        "last_order_date": np.maximum.reduceat(last, starts) if len(cust) else last,
+        "lifetime_orders": np.add.reduceat(orders, starts) if len(cust) else orders,
+        "lifetime_revenue": np.add.reduceat(revenue, starts) if len(cust) else revenue,
+    })
+
+    # Attribute new activity pairs to each customer's acquisition cohort
+    merged_cust = merged["customer_key"].to_numpy(dtype=np.int64)
+    cohort = _month_index(merged["first_order_date"].to_numpy(dtype="datetime64[D]"))
+    pair_cohort = cohort[np.searchsorted(merged_cust, pair_cust)]
+    new_activity = pd.DataFrame({
+        "cohort_month_idx": pair_cohort,
+        "period": pair_month - pair_cohort,
+        "active_customers": 1,
+    })
+    activity = (
+        pd.concat([activity, new_activity], ignore_index=True)
+        .astype({"cohort_month_idx": np.int64, "period": np.int64, "active_customers": np.int64})
+        .groupby(["cohort_month_idx", "period"], as_index=False)["active_customers"].sum()
+    )
+    return merged, activity
+
+
+# -----------------------------
+# 4) Derived tables
+# -----------------------------
+def build_retention_matrix(activity: pd.DataFrame) -> pd.DataFrame:
+    """
+    Pivot cohort activity into a retention-rate matrix (period 0 = 1.0).
+
+    Periods after the last observed month are left empty rather than 0, so
+    "nobody came back" and "not observed yet" stay distinguishable.
+    """
+    matrix = activity.pivot(index="cohort_month_idx", columns="period", values="active_customers")
+    last_month = (activity["cohort_month_idx"] + activity["period"]).max()
+    observed = matrix.columns.to_numpy()[None, :] <= (last_month - matrix.index.to_numpy())[:, None]
+    matrix = matrix.fillna(0).where(observed)
+    matrix = matrix.div(matrix[0], axis=0).round(4)
+    matrix.index = _month_label(matrix.index.to_numpy())
+    matrix.index.name = "cohort_month"
+    matrix.columns = [f"month_{p}" for p in matrix.columns]
+    return matrix.reset_index()
+
+
+def apply_segment_rules(df: pd.DataFrame, rules=SEGMENT_RULES, default=DEFAULT_SEGMENT) -> pd.Series:
+    """Evaluate ordered (segment, expression) rules; the first match wins."""
+    segment = pd.Series(default, index=df.index, dtype=object)
+    assigned = np.zeros(len(df), dtype=bool)
+    for name, expr in rules:
+        hit = df.eval(expr).fillna(False).to_numpy(dtype=bool) & ~assigned
+        segment[hit] = name
+        assigned |= hit
+    return segment
+
+
+def build_customer_segments(state: pd.DataFrame, customers: pd.DataFrame, as_of=None) -> pd.DataFrame:
+    """
+    Compute recency, RFM scores, segment and churn risk status per customer.
+
+    Every customer in gold.dim_customers is kept (like the LEFT JOIN in
+    churn_analysis); customers with no purchases are CHURNED, score 1 on
+    R, F and M, and have no recency or cohort.
+    """
+    as_of = np.datetime64(as_of or pd.Timestamp.today().normalize(), "D")
+
+    df = customers.merge(state, on="customer_key", how="outer").sort_values("customer_key", ignore_index=True)
+    df["lifetime_orders"] = df["lifetime_orders"].fillna(0).astype(np.int64)
+    df["lifetime_revenue"] = df["lifetime_revenue"].fillna(0.0)
+
+    purchased = df["first_order_date"].notna().to_numpy()
+    first = df.loc[purchased, "first_order_date"].to_numpy(dtype="datetime64[D]")
+    last = df.loc[purchased, "last_order_date"].to_numpy(dtype="datetime64[D]")
+
+    df["cohort_month"] = None
+    df.loc[purchased, "cohort_month"] = _month_label(_month_index(first))
+    df["lifespan_months"] = pd.array([pd.NA] * len(df), dtype="Int64")
+    df.loc[purchased, "lifespan_months"] = _month_index(last) - _month_index(first)
+    days = np.full(len(df), np.inf)
+    days[purchased] = (as_of - last).astype(np.int64)
+    df["days_since_last_purchase"] = pd.Series(days).where(purchased).astype("Int64")
+
+    # Lower recency is better, so score its negation (never purchased = -inf)
+    df["r_score"] = _quantile_score(-days, RFM_QUANTILES)
+    df["f_score"] = _quantile_score(df["lifetime_orders"].to_numpy(), RFM_QUANTILES)
+    df["m_score"] = _quantile_score(df["lifetime_revenue"].to_numpy(), RFM_QUANTILES)
+    for col in ["r_score", "f_score", "m_score"]:
+        if not df[col].between(1, RFM_QUANTILES).all():
+            raise ValueError(f"{col} outside 1..{RFM_QUANTILES}")
+    df["rfm_score"] = df["r_score"].astype(str) + df["f_score"].astype(str) + df["m_score"].astype(str)
+
+    df["customer_segment"] = apply_segment_rules(df)
+    df["risk_status"] = np.select(
+        [days >= CHURNED_DAYS, days >= AT_RISK_DAYS],
+        ["CHURNED", "AT_RISK"],
+        default="ACTIVE",
+    )
+    return df
+
+
+def load_dim_customers() -> pd.DataFrame:
+    """Read customer_key and country for every customer in gold.dim_customers."""
+    if SOURCE == "sql":
+        conn = _connect()
+        df = pd.read_sql("SELECT customer_key, country FROM gold.dim_customers", conn)
+        conn.close()
+        return df
+    return pd.read_csv(DIM_CUSTOMERS_CSV, usecols=["customer_key", "country"])
+
+
+# -----------------------------
+# 5) Load to SQL
+# -----------------------------
+SEGMENT_TABLE_COLUMNS = [
+    "customer_key",
+    "country",
+    "first_order_date",
+    "last_order_date",
+    "lifetime_orders",
+    "lifetime_revenue",
+    "cohort_month",
+    "lifespan_months",
+    "days_since_last_purchase",
+    "r_score",
+    "f_score",
+    "m_score",
+    "rfm_score",
+    "customer_segment",
+    "risk_status",
+]
+
+
+def load_segments_to_sql(segments: pd.DataFrame) -> int:
+    """
+    Replace gold.customer_segments with the cached segments.
+
+    The table is created by datawarehouse/scripts/gold/ddl_customer_segments.sql;
+    gold.v_customer_churn_status, gold.v_ai_churn_input and the A/B eligibility
+    filter read from it.
+    """
+    df = segments[SEGMENT_TABLE_COLUMNS].copy()
+    for col in ["first_order_date", "last_order_date"]:
+        df[col] = df[col].dt.date
+    df["lifetime_revenue"] = df["lifetime_revenue"].round(2)
+    df = df.astype(object).where(df.notna(), None)
+    refreshed_at = pd.Timestamp.now().to_pydatetime()
+    rows = [tuple(r) + (refreshed_at,) for r in df.itertuples(index=False)]
+
+    insert_sql = f"""
+    INSERT INTO gold.customer_segments ({', '.join(SEGMENT_TABLE_COLUMNS)}, refreshed_at)
+    VALUES ({', '.join(['?'] * (len(SEGMENT_TABLE_COLUMNS) + 1))});
+    """
+
+    conn = _connect()
+    cursor = conn.cursor()
+    cursor.fast_executemany = True
+    cursor.execute("DELETE FROM gold.customer_segments;")
+    cursor.executemany(insert_sql, rows)
+    conn.commit()
+    cursor.close()
+    conn.close()
+    return len(rows)
+
+
+# -----------------------------
+# 6) Run
+# -----------------------------
+def run(full_refresh: bool = False, as_of=None, to_sql: bool = False) -> pd.DataFrame:
+    start = time.perf_counter()
+    state, activity = (None, None) if full_refresh else load_state()
+    watermark = None if state is None or state.empty else state["last_order_date"].max()
+
+    print(f"✅ Loading fact_sales ({'full' if watermark is None else f'after {watermark.date()}'})...")
+    sales = load_fact_sales(after_date=watermark)
+    print(f"✅ Loaded {len(sales)} order lines")
+
+    batch = aggregate_batch(sales)
+    state, activity = merge_batch(state, activity, batch)
+    segments = build_customer_segments(state, load_dim_customers(), as_of=as_of)
+    retention = build_retention_matrix(activity) if not activity.empty else pd.DataFrame()
+
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    state.to_csv(os.path.join(CACHE_DIR, "customer_state.csv"), index=False)
+    activity.to_csv(os.path.join(CACHE_DIR, "cohort_activity.csv"), index=False)
+    retention.to_csv(os.path.join(CACHE_DIR, "cohort_retention.csv"), index=False)
+    segments.to_csv(os.path.join(CACHE_DIR, "customer_segments.csv"), index=False)
+
+    print(f"✅ Cached {len(segments)} customers, {len(retention)} cohorts in {CACHE_DIR}")
+    print(segments["customer_segment"].value_counts().to_string())
+    print(segments["risk_status"].value_counts().to_string())
+    if to_sql:
+        print(f"✅ Loaded {load_segments_to_sql(segments)} rows into gold.customer_segments")
+    print(f"✅ Done in {time.perf_counter() - start:.1f}s")
+    return segments
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Cohort retention & RFM segmentation engine")
+    parser.add_argument("--full", action="store_true", help="Ignore cached state and rebuild")
+    parser.add_argument("--as-of", default=None, help="Reference date for recency (default: today)")
+    parser.add_argument("--to-sql", action="store_true", help="Replace gold.customer_segments with the result")
+    args = parser.parse_args()
+    run(full_refresh=args.full, as_of=args.as_of, to_sql=args.to_sql)
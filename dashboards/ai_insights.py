@@ -16,6 +16,7 @@ Business Context:
 
 Data Source:
     View: gold.v_ai_churn_input
+    (or ENGINE_CACHE_CSV: customer_segments.csv cached by cohort_rfm_engine.py)
     Key fields pulled:
         • customer_key
         • risk_status
@@ -82,6 +83,24 @@ FROM gold.v_ai_churn_input
 ORDER BY days_since_last_purchase DESC;
 """
 
+# Optional: reuse the cached output of analytics/code directory/cohort_rfm_engine.py
+# instead of querying SQL Server. Leave as None to read gold.v_ai_churn_input.
+ENGINE_CACHE_CSV = None  # e.g. "../analytics/code directory/customer_engine_cache/customer_segments.csv"
+
+def load_input() -> pd.DataFrame:
+    """Pull at-risk / churned customers from the engine cache or the gold view."""
+    if ENGINE_CACHE_CSV:
+        df = pd.read_csv(ENGINE_CACHE_CSV)
+        df = df[df["risk_status"].isin(["AT_RISK", "CHURNED"])]
+        # Customers with no purchases have no recency in the cache
+        df["days_since_last_purchase"] = df["days_since_last_purchase"].fillna(0)
+        return df.sort_values("days_since_last_purchase", ascending=False).head(200)
+
+    conn = pyodbc.connect(conn_str, timeout=10)
+    df = pd.read_sql(QUERY, conn)
+    conn.close()
+    return df
+
 def generate_rule_based_insight(row: pd.Series) -> dict:
     """Fallback 'AI-like' explanation without calling any API."""
     days = int(row.get("days_since_last_purchase", 0) or 0)
@@ -128,11 +147,9 @@ def generate_rule_based_insight(row: pd.Series) -> dict:
 
 def main():
     print("✅ Starting AI insights generation...")
-    conn = pyodbc.connect(conn_str, timeout=10)
-    df = pd.read_sql(QUERY, conn)
-    conn.close()
+    df = load_input()
 
-    print(f"✅ Pulled {len(df)} rows from gold.v_ai_churn_input")
+    print(f"✅ Pulled {len(df)} rows from {ENGINE_CACHE_CSV or 'gold.v_ai_churn_input'}")
 
     # -----------------------------
     # 3) Generate insights
@@ -37,6 +37,7 @@ Objects Created:
 
 Data Flow:
     1. gold.v_customer_churn_status
+       (over gold.customer_segments, see ddl_customer_segments.sql)
            ↓ (filtered)
        gold.v_ai_churn_input
            ↓ (Python / ai_insights.py)
@@ -0,0 +1,70 @@
+/*
+===============================================================================
+DDL Script: Customer Segments Table & Churn Status View
+===============================================================================
+Script Purpose:
+    - Creates gold.customer_segments, the SQL copy of customer_segments.csv
+      cached by analytics/code directory/cohort_rfm_engine.py.
+    - Rebuilds gold.v_customer_churn_status on top of it, so the churn risk
+      status, gold.v_ai_churn_input (AI insights) and the A/B eligibility
+      filter (random_assignment.sql) all read the same engine output.
+
+Table Description:
+    gold.customer_segments (one row per customer in gold.dim_customers)
+        • customer_key               → Customer surrogate key (PK)
+        • country                    → From gold.dim_customers
+        • first_order_date           → NULL if the customer never purchased
+        • last_order_date            → NULL if the customer never purchased
+        • lifetime_orders            → Distinct orders
+        • lifetime_revenue           → SUM(sales_amount)
+        • cohort_month               → Acquisition month (YYYY-MM)
+        • lifespan_months            → Months between first and last order
+        • days_since_last_purchase   → As of the engine run date
+        • r_score / f_score / m_score → RFM quantile scores (1 = lowest)
+        • rfm_score                  → e.g. '555'
+        • customer_segment           → VIP / Regular / New / No Purchase
+        • risk_status                → ACTIVE / AT_RISK / CHURNED
+        • refreshed_at               → Timestamp of the engine load
+
+Usage:
+    - Run once before the first load:
+        python cohort_rfm_engine.py --full --to-sql
+    - Each --to-sql run replaces the table contents (RFM scores are relative
+      to the whole customer base, so rows are not merged individually).
+===============================================================================
+*/
+
+IF OBJECT_ID('gold.customer_segments', 'U') IS NULL
+CREATE TABLE gold.customer_segments (
+    customer_key BIGINT NOT NULL,
+    country NVARCHAR(50) NULL,
+    first_order_date DATE NULL,
+    last_order_date DATE NULL,
+    lifetime_orders INT NOT NULL,
+    lifetime_revenue DECIMAL(18, 2) NOT NULL,
+    cohort_month CHAR(7) NULL,
+    lifespan_months INT NULL,
+    days_since_last_purchase INT NULL,
+    r_score TINYINT NOT NULL,
+    f_score TINYINT NOT NULL,
+    m_score TINYINT NOT NULL,
+    rfm_score CHAR(3) NOT NULL,
+    customer_segment NVARCHAR(50) NOT NULL,
+    risk_status VARCHAR(20) NOT NULL,
+    refreshed_at DATETIME2 NOT NULL,
+    PRIMARY KEY (customer_key)
+);
+GO
+
+CREATE OR ALTER VIEW gold.v_customer_churn_status AS
+SELECT
+    customer_key,
+    country,
+    risk_status,
+    days_since_last_purchase,
+    lifetime_revenue,
+    lifetime_orders,
+    customer_segment,
+    rfm_score
+FROM gold.customer_segments;
+GO